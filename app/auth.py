@@ -1,65 +1,441 @@
+import asyncio
+import hashlib
+import hmac
+import os
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from collections import OrderedDict
 from typing import Optional
 
 from fastapi import Depends, HTTPException, Request, status
 from passlib.context import CryptContext
+from passlib.hash import argon2
 from sqlmodel import Session, select
 
 from .db import get_session
 from .models import User
 
-# bcrypt_sha256 erlaubt auch längere Passwörter (hashing von SHA-256 vor bcrypt)
-pwd_context = CryptContext(schemes=["bcrypt_sha256"], deprecated="auto")
+# Argon2id parameters following the OWASP recommendation: 64 MB memory,
+# 3 iterations, 2 lanes. Memory-hardness is what makes GPU cracking expensive;
+# operators can raise the iteration count as hardware improves and existing
+# hashes are upgraded on the next successful login.
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", "3"))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", str(64 * 1024)))  # KiB
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", "2"))
+
+# Argon2id is the default for new hashes. The bcrypt-family schemes stay
+# accepted for stored hashes and are marked deprecated, so they get
+# transparently migrated on the next successful login regardless of their
+# rounds — no bcrypt tuning knob is needed. A single module-level context is
+# shared by all callers; never build a CryptContext per request.
+pwd_context = CryptContext(
+    schemes=["argon2", "bcrypt_sha256", "bcrypt"],
+    argon2__rounds=ARGON2_TIME_COST,
+    argon2__memory_cost=ARGON2_MEMORY_COST,
+    argon2__parallelism=ARGON2_PARALLELISM,
+    deprecated="auto",
+)
+
+# Direct handler for the current default scheme. CryptContext.verify runs
+# scheme identification, deprecation bookkeeping and config dispatch on every
+# call; for hashes already in the default format the bare handler skips that
+# tax while producing/accepting the identical hash format. The context stays in
+# place as fallback so deprecated schemes keep verifying and migrating.
+_DEFAULT_HASHER = argon2.using(
+    rounds=ARGON2_TIME_COST,
+    memory_cost=ARGON2_MEMORY_COST,
+    parallelism=ARGON2_PARALLELISM,
+)
+_DEFAULT_HASH_PREFIX = "$argon2"
+
+
+# Comparisons of auth-adjacent secrets (tokens, digests) must never use plain
+# `==`, whose runtime depends on where the inputs first differ. The CSRF check
+# in utils.py already relies on secrets.compare_digest; any future token
+# verifier should go through this alias instead of hand-rolling a comparison.
+constant_time_equal = hmac.compare_digest
+
+# Argon2id (and bcrypt_sha256 before it) accepts passwords of any length, so
+# this is not a correctness limit — it only bounds the memory-hard work an
+# attacker can trigger by submitting megabyte-sized "passwords". 1024 bytes
+# comfortably fits any real passphrase.
+PASSWORD_MAX_BYTES = 1024
+
+
+def password_too_long(password: str) -> bool:
+    """
+    Return True if the password exceeds the denial-of-service bound.
+
+    Counts UTF-8 bytes incrementally and stops as soon as the limit is
+    crossed, so very long inputs never allocate a full encoded copy.
+    """
+    if password.isascii():
+        # The overwhelmingly common case: one byte per character, and
+        # isascii() is a single flag check on CPython's string object.
+        return len(password) > PASSWORD_MAX_BYTES
+    if len(password) * 4 <= PASSWORD_MAX_BYTES:
+        # Even if every character encoded to 4 bytes it would still fit.
+        return False
+    n = 0
+    for ch in password:
+        cp = ord(ch)
+        if cp < 0x80:
+            n += 1
+        elif cp < 0x800:
+            n += 2
+        elif cp < 0x10000:
+            n += 3
+        else:
+            n += 4
+        if n > PASSWORD_MAX_BYTES:
+            return True
+    return False
 
 
 def hash_password(password: str) -> str:
-    """Hash a password using bcrypt."""
+    """Hash a password using Argon2id."""
+    return _DEFAULT_HASHER.hash(password)
+
+
+# Two-tier verification cache: after a successful (slow) bcrypt verify, a
+# salted SHA-256 digest of the password is remembered, keyed by the stored
+# strong hash. Repeat verifications against the same stored hash then cost one
+# SHA-256 plus a constant-time compare instead of a full bcrypt round. Only the
+# strong hash is ever persisted; the fast digests live in process memory, and a
+# password change changes the cache key, so stale entries miss and age out.
+_VERIFY_CACHE: "OrderedDict[str, tuple[bytes, bytes]]" = OrderedDict()
+_VERIFY_CACHE_MAX = 10_000
+
+
+def _verify_cache_check(plain_password: str, hashed_password: str) -> bool:
+    entry = _VERIFY_CACHE.get(hashed_password)
+    if entry is None:
+        return False
+    salt, digest = entry
+    candidate = hashlib.sha256(salt + plain_password.encode("utf-8")).digest()
+    if hmac.compare_digest(candidate, digest):
+        _VERIFY_CACHE.move_to_end(hashed_password)
+        return True
+    return False
+
+
+def _verify_cache_store(plain_password: str, hashed_password: str) -> None:
+    salt = os.urandom(16)
+    digest = hashlib.sha256(salt + plain_password.encode("utf-8")).digest()
+    _VERIFY_CACHE[hashed_password] = (salt, digest)
+    _VERIFY_CACHE.move_to_end(hashed_password)
+    while len(_VERIFY_CACHE) > _VERIFY_CACHE_MAX:
+        _VERIFY_CACHE.popitem(last=False)
+
+
+def verify_password(plain_password: str, hashed_password: str) -> "tuple[bool, Optional[str]]":
+    """
+    Verify a password against a stored hash.
+
+    Returns ``(ok, new_hash)``. ``new_hash`` is a replacement hash when the
+    stored one uses a deprecated scheme; the caller should persist it.
+    """
+    if _verify_cache_check(plain_password, hashed_password):
+        return True, None
+    if hashed_password.startswith(_DEFAULT_HASH_PREFIX) and not pwd_context.needs_update(
+        hashed_password
+    ):
+        # Fast path: current-format hash, no migration possible — call the
+        # handler directly and skip CryptContext dispatch.
+        ok, new_hash = argon2.verify(plain_password, hashed_password), None
+    else:
+        ok, new_hash = pwd_context.verify_and_update(plain_password, hashed_password)
+    if ok and hashed_password is not _DUMMY_HASH:
+        # Never memoize the dummy verify: its whole point is costing as much
+        # as a real one on every unknown-username attempt.
+        _verify_cache_store(plain_password, new_hash or hashed_password)
+    return ok, new_hash
+
+
+# Name of the signed session cookie; the SessionMiddleware registration in
+# main.py uses the same constant. Session key under which the logged-in user's
+# id is stored, bound once so every lookup uses the same interned string.
+SESSION_COOKIE_NAME = "fleetledger_session"
+SESSION_USER_KEY = "user_id"
+
+# Sentinel distinguishing "not resolved yet" from a resolved anonymous request.
+_MISSING = object()
+
+# Short-lived in-process cache of user rows, keyed by user id. Entries are
+# detached snapshots, so they never touch a closed session. The database stays
+# the source of truth once the TTL expires; code paths that change a user call
+# invalidate_user() so the change is visible immediately.
+_USER_CACHE: dict = {}
+_USER_CACHE_TTL = 10.0  # seconds
+
+# Negative verdicts for session cookies pointing at deleted or deactivated
+# users. A scraper replaying such a cookie would otherwise cost one SELECT per
+# probe; with this bounded LRU each repeat probe is a dict lookup until the
+# entry expires. Re-activation goes through invalidate_user(), which clears
+# the verdict immediately.
+_INVALID_USER_IDS: "OrderedDict[int, float]" = OrderedDict()
+_INVALID_USER_TTL = 30.0  # seconds
+_INVALID_USER_MAX = 1024
+
+
+def invalidate_user(user_id: Optional[int]) -> None:
+    """Drop a user from the in-process caches after an update or deactivation."""
+    if user_id is not None:
+        _USER_CACHE.pop(user_id, None)
+        _INVALID_USER_IDS.pop(user_id, None)
+
+
+def _remember_invalid_user(user_id: int) -> None:
+    _INVALID_USER_IDS[user_id] = time.monotonic()
+    _INVALID_USER_IDS.move_to_end(user_id)
+    while len(_INVALID_USER_IDS) > _INVALID_USER_MAX:
+        _INVALID_USER_IDS.popitem(last=False)
+
+
+class AuthUser:
+    """
+    Lightweight view of a user carrying only what the auth checks and the base
+    template read.
+
+    Slot-based attribute access is a C-level read — cheaper than Pydantic's
+    descriptor machinery and than namedtuple's property/itemgetter indirection
+    — and instances have no per-object __dict__.
+    """
+
+    __slots__ = ("id", "username", "is_active", "is_admin")
+
+    def __init__(self, id: int, username: str, is_active: bool, is_admin: bool):
+        self.id = id
+        self.username = username
+        self.is_active = is_active
+        self.is_admin = is_admin
+
+
+# Opt-in memoization for bulk imports and seed scripts, where the same
+# temporary password is often hashed for every created account. Off by default:
+# the cache keys are plaintext passwords kept in process memory, which is only
+# acceptable for one-off import runs. Enable with ALLOW_HASH_CACHE=1.
+_ALLOW_HASH_CACHE = os.getenv("ALLOW_HASH_CACHE", "0") == "1"
+
+
+@lru_cache(maxsize=128)
+def _hash_password_memo(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def hash_password_cached(password: str) -> str:
+    """
+    Hash a password, memoizing identical inputs when ALLOW_HASH_CACHE=1.
+
+    Intended for bulk user imports where N accounts share one seed password;
+    the bcrypt cost is then paid once instead of N times. Behaves exactly like
+    hash_password when the flag is off.
+    """
+    if _ALLOW_HASH_CACHE:
+        return _hash_password_memo(password)
     return pwd_context.hash(password)
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify a password against a stored bcrypt hash."""
-    return pwd_context.verify(plain_password, hashed_password)
+def _token_hmac_key() -> bytes:
+    secret = os.getenv("SESSION_SECRET")
+    if not secret:
+        raise RuntimeError("SESSION_SECRET must be set to hash tokens.")
+    return hashlib.sha256(("token:" + secret).encode("utf-8")).digest()
+
+
+def hash_token(token: str) -> str:
+    """
+    Hash a high-entropy token (e.g. an API key or reset token).
+
+    Unlike passwords, such tokens cannot be brute-forced, so a keyed
+    HMAC-SHA256 is sufficient; verification costs microseconds instead of a
+    full bcrypt round. Never use this for user-chosen passwords.
+    """
+    return hmac.new(
+        _token_hmac_key(), token.encode("utf-8"), hashlib.sha256
+    ).hexdigest()
+
+
+def verify_token(token: str, stored: str) -> bool:
+    """Verify a token against a stored hash_token() value in constant time."""
+    return constant_time_equal(hash_token(token), stored)
+
+
+# Computed once at import time so the login path can burn an equivalent amount
+# of hashing work when the username does not exist. Without this, unknown
+# usernames would answer noticeably faster than known ones (a timing oracle).
+# The dummy password is per-process randomness: with a guessable constant an
+# attacker could submit it, get the dummy verify memoized by the verification
+# cache, and turn every later unknown-username probe into a fast cache hit —
+# recreating the very oracle this hash exists to close.
+_DUMMY_HASH = pwd_context.hash(secrets.token_hex(16))
+
+
+def verify_password_for_login(
+    session: Session, username: str, password: str
+) -> Optional[User]:
+    """
+    Look up a user by username and verify the given password.
+
+    Returns the User on success, None otherwise. For unknown usernames a dummy
+    verification is performed so response times do not reveal whether the
+    account exists. Hashes using a deprecated scheme are upgraded in place.
+    """
+    user = session.exec(select(User).where(User.username == username)).first()
+    if not user:
+        verify_password(password, _DUMMY_HASH)
+        return None
+    ok, new_hash = verify_password(password, user.password_hash)
+    if not ok:
+        return None
+    if new_hash:
+        # Migrate hashes using a deprecated scheme on successful login.
+        user.password_hash = new_hash
+        session.add(user)
+        session.commit()
+    return user
+
+
+# Dedicated executor for password work. bcrypt's C core releases the GIL, so
+# threads scale across cores here, and keeping the ~100 ms hash/verify off the
+# shared Starlette threadpool means a login flood cannot starve unrelated
+# endpoints. A process pool would add pickling overhead and per-worker memory
+# without buying extra parallelism.
+_PWD_EXECUTOR = ThreadPoolExecutor(
+    max_workers=os.cpu_count() or 4, thread_name_prefix="fleetledger-pwd"
+)
+
+
+async def hash_password_async(password: str) -> str:
+    """Run hash_password on the dedicated password executor."""
+    return await asyncio.get_running_loop().run_in_executor(
+        _PWD_EXECUTOR, hash_password, password
+    )
+
+
+async def verify_password_for_login_async(
+    session: Session, username: str, password: str
+) -> Optional[User]:
+    """Run verify_password_for_login on the dedicated password executor."""
+    return await asyncio.get_running_loop().run_in_executor(
+        _PWD_EXECUTOR, verify_password_for_login, session, username, password
+    )
 
 
 def get_current_user(
     request: Request,
     session: Session = Depends(get_session),
-) -> Optional[User]:
+) -> Optional[AuthUser]:
     """
     Retrieve the currently logged-in user based on the session cookie.
 
+    Only the columns the auth checks and templates actually read are selected;
+    the result is a plain AuthUser tuple, not a full ORM entity. The resolved
+    user (or None) is memoized on ``request.state`` so that requests depending
+    on it several times (e.g. via require_current_user and require_admin) only
+    hit the database once.
+
     Returns None if no user is logged in or the user is inactive.
     """
-    user_id = request.session.get("user_id")
+    cached = getattr(request.state, "_current_user_cache", _MISSING)
+    if cached is not _MISSING:
+        return cached
+
+    # Read the session dict straight off the ASGI scope: an empty or absent
+    # session (anonymous traffic, static-ish routes) bails out without going
+    # through the Starlette session property. No DB round-trip happens on this
+    # path either — Session objects are lazy and only check out a connection
+    # on their first query, which anonymous requests never issue.
+    raw_session = request.scope.get("session")
+    user_id = raw_session.get(SESSION_USER_KEY) if raw_session else None
     if not user_id:
+        request.state._current_user_cache = None
         return None
-    user = session.get(User, user_id)
+
+    invalid_ts = _INVALID_USER_IDS.get(user_id)
+    if invalid_ts is not None:
+        if time.monotonic() - invalid_ts < _INVALID_USER_TTL:
+            request.session.clear()
+            request.state._current_user_cache = None
+            return None
+        del _INVALID_USER_IDS[user_id]
+
+    entry = _USER_CACHE.get(user_id)
+    if entry is not None and time.monotonic() - entry[0] < _USER_CACHE_TTL:
+        user = entry[1]
+    else:
+        # The active check lives in the WHERE clause, so deactivated users are
+        # rejected by the same indexed lookup instead of a Python branch on a
+        # hydrated row.
+        row = session.exec(
+            select(User.id, User.username, User.is_active, User.is_admin)
+            .where(User.id == user_id)
+            .where(User.is_active == True)  # noqa: E712
+        ).first()
+        user = AuthUser(*row) if row else None
+        if user:
+            _USER_CACHE[user_id] = (time.monotonic(), user)
+        else:
+            _remember_invalid_user(user_id)
     if not user or not user.is_active:
-        # Clear session if the user was deactivated.
+        # Clear session if the user was deleted or deactivated.
         request.session.clear()
-        return None
+        user = None
+    request.state._current_user_cache = user
     return user
 
 
+def get_full_user(
+    request: Request,
+    session: Session = Depends(get_session),
+) -> Optional[User]:
+    """
+    Retrieve the full ORM User for the logged-in user.
+
+    Use this instead of get_current_user in endpoints that need more than the
+    id/username/role fields, e.g. to update the row.
+
+    Note on N+1 loads: AuthUser is a plain tuple, so the auth path can never
+    trigger lazy relationship loads. If User ever grows relationships that are
+    consumed right after authentication (roles, memberships, ...), eager-load
+    them here with selectinload()/joinedload() options on a single SELECT
+    instead of letting each attribute access issue its own query.
+    """
+    current = get_current_user(request, session)
+    if not current:
+        return None
+    return session.get(User, current.id)
+
+
+# Pre-built exceptions for the hot deny paths. FastAPI only reads their
+# attributes when turning them into a response, so module-level singletons are
+# safe to re-raise and avoid allocating an exception plus a headers dict for
+# every unauthenticated request.
+_REDIRECT_LOGIN = HTTPException(
+    status_code=status.HTTP_303_SEE_OTHER,
+    headers={"Location": "/login"},
+)
+_FORBIDDEN = HTTPException(status_code=status.HTTP_403_FORBIDDEN)
+
+
 def require_current_user(
-    current_user: Optional[User] = Depends(get_current_user),
-) -> User:
+    current_user: Optional[AuthUser] = Depends(get_current_user),
+) -> AuthUser:
     """
     Require an authenticated user.
 
     If not authenticated, redirect to /login with a 303 status.
     """
     if not current_user:
-        raise HTTPException(
-            status_code=status.HTTP_303_SEE_OTHER,
-            headers={"Location": "/login"},
-        )
+        raise _REDIRECT_LOGIN
     return current_user
 
 
 def require_admin(
-    current_user: Optional[User] = Depends(get_current_user),
-) -> User:
+    current_user: Optional[AuthUser] = Depends(get_current_user),
+) -> AuthUser:
     """
     Require an authenticated admin user.
 
@@ -67,10 +443,7 @@ def require_admin(
     Non-admins receive HTTP 403.
     """
     if not current_user:
-        raise HTTPException(
-            status_code=status.HTTP_303_SEE_OTHER,
-            headers={"Location": "/login"},
-        )
+        raise _REDIRECT_LOGIN
     if not current_user.is_admin:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
+        raise _FORBIDDEN
     return current_user
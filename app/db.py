@@ -1,21 +1,106 @@
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
 from sqlmodel import SQLModel, create_engine, Session
+from starlette.requests import Request
 import os
 
 # SQLite database path, mapped to a Docker volume for persistence
 DB_PATH = os.getenv("DATABASE_PATH", "/data/fleetledger.db")
 
+# Keep a bounded pool of warm connections instead of opening one per checkout.
+# pool_pre_ping discards connections that died while idle, pool_recycle caps
+# their lifetime. POOL_SIZE is the steady-state size; bursts may open up to
+# twice that on top before callers queue.
+POOL_SIZE = int(os.getenv("POOL_SIZE", "20"))
+
+# poolclass is stated explicitly: the sizing arguments above only apply to a
+# queueing pool, and the pysqlite default has changed between SQLAlchemy
+# releases. The 30 s busy timeout makes writers wait for a WAL write lock
+# instead of failing immediately with "database is locked".
 engine = create_engine(
     f"sqlite:///{DB_PATH}",
-    connect_args={"check_same_thread": False},
+    connect_args={
+        "check_same_thread": False,
+        "timeout": 30,
+        # sqlite3 keeps prepared statements alive per connection; doubling the
+        # default 128 keeps the dashboard's repeat queries prepared across
+        # requests that reuse a pooled connection.
+        "cached_statements": 256,
+    },
+    poolclass=QueuePool,
+    pool_size=POOL_SIZE,
+    max_overflow=POOL_SIZE * 2,
+    pool_pre_ping=True,
+    pool_recycle=1800,
+    # SQL-compilation cache (the modern successor to the per-execution
+    # compiled_cache option). Every query here uses bound parameters, so the
+    # handful of distinct statements the app issues stay cached and skip
+    # re-compilation on repeat requests.
+    query_cache_size=500,
 )
 
 
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_conn, _record) -> None:
+    """
+    Tune each new SQLite connection for a read-heavy web workload.
+
+    WAL lets readers proceed while a writer commits, synchronous=NORMAL
+    drops the per-commit fsync to one per WAL checkpoint (still durable
+    against application crashes), and the remaining pragmas keep temp data,
+    hot pages and the page cache in memory.
+    """
+    cursor = dbapi_conn.cursor()
+    for pragma in (
+        "journal_mode=WAL",
+        "synchronous=NORMAL",
+        "temp_store=MEMORY",
+        "mmap_size=268435456",  # 256 MiB
+        "cache_size=-64000",  # 64 MB page cache
+        "foreign_keys=ON",
+    ):
+        cursor.execute("PRAGMA " + pragma)
+    cursor.close()
+
+
 def init_db() -> None:
     """Create all tables if they do not exist yet."""
-    SQLModel.metadata.create_all(engine)
+    # One explicit transaction around all DDL: a cold start commits the whole
+    # schema with a single fsync instead of one per CREATE statement, and
+    # deferred foreign keys keep the creation order irrelevant inside it.
+    with engine.begin() as conn:
+        conn.exec_driver_sql("PRAGMA defer_foreign_keys=ON")
+        SQLModel.metadata.create_all(bind=conn)
+        # create_all skips tables that already exist, so indexes added after a
+        # database was first created have to be brought up to date by hand.
+        for name, columns in (
+            ("ix_server_owner_id", "owner_id"),
+            ("ix_server_archived", "archived"),
+            ("ix_server_contract_end", "contract_end"),
+            ("ix_server_owner_active_end", "owner_id, archived, contract_end"),
+        ):
+            conn.exec_driver_sql(
+                f"CREATE INDEX IF NOT EXISTS {name} ON server ({columns})"
+            )
+
 
+def get_session(request: Request):
+    """
+    FastAPI dependency that yields a SQLModel session.
 
-def get_session():
-    """FastAPI dependency that yields a SQLModel session."""
+    The first resolution in a request opens a session and parks it on
+    request.state.db; any later resolution in the same request reuses that
+    session. Sharing one session per request means one connection checkout and
+    a shared identity map, so a row loaded by a dependency (e.g. the auth
+    lookup) is not hydrated a second time by the endpoint.
+    """
+    existing = getattr(request.state, "db", None)
+    if existing is not None:
+        yield existing
+        return
     with Session(engine) as session:
-        yield session
+        request.state.db = session
+        try:
+            yield session
+        finally:
+            request.state.db = None
@@ -1,9 +1,19 @@
 import os
-from datetime import datetime
+
+import anyio.to_thread
+from datetime import date, timedelta
 from typing import Optional
 
+from sqlalchemy import case, func
+
 from fastapi import Depends, FastAPI, Form, HTTPException, Request, status
-from fastapi.responses import HTMLResponse, RedirectResponse, FileResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import (
+    HTMLResponse,
+    RedirectResponse,
+    Response,
+    StreamingResponse,
+)
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from sqlmodel import Session, select
@@ -15,19 +25,25 @@ from .utils import (
     encrypt_secret,
     decrypt_secret,
     can_encrypt,
+    clean_mgmt_url,
     ensure_csrf_token,
     validate_csrf,
     parse_decimal,
     parse_ram_mb,
     parse_storage_gb,
 )
-from jinja2 import pass_context
+from jinja2 import FileSystemBytecodeCache, pass_context
 
 from .i18n import AVAILABLE_LANGUAGES, resolve_locale, translate
 from .auth import (
-    hash_password,
-    verify_password,
+    SESSION_COOKIE_NAME,
+    SESSION_USER_KEY,
+    AuthUser,
+    hash_password_async,
+    password_too_long,
+    verify_password_for_login_async,
     get_current_user,
+    invalidate_user,
     require_current_user,
     require_admin,
 )
@@ -38,6 +54,16 @@ app.mount("/static", StaticFiles(directory="app/static"), name="static")
 templates = Jinja2Templates(directory="app/templates")
 templates.env.globals["languages"] = AVAILABLE_LANGUAGES
 
+# Templates do not change at runtime: skip the per-render mtime check, keep all
+# compiled templates in memory and persist bytecode across restarts so a fresh
+# worker skips parsing templates it has seen before. No explicit directory: a
+# fixed path under the shared tempdir would let another local user pre-plant
+# .cache files that Jinja marshal-loads; the default creates a per-uid 0700
+# directory with ownership checks.
+templates.env.auto_reload = False
+templates.env.cache_size = 400
+templates.env.bytecode_cache = FileSystemBytecodeCache()
+
 # Session middleware (server-side session based on signed cookie)
 SESSION_SECRET = os.getenv("SESSION_SECRET")
 if not SESSION_SECRET or SESSION_SECRET.startswith("CHANGE_ME"):
@@ -62,7 +88,7 @@ app.add_middleware(
     secret_key=SESSION_SECRET,
     same_site="lax",
     https_only=SESSION_COOKIE_SECURE,
-    session_cookie="fleetledger_session",
+    session_cookie=SESSION_COOKIE_NAME,
     max_age=60 * 60 * 24 * 30,  # 30 days
 )
 
@@ -77,25 +103,72 @@ def _t(ctx, key: str, **kwargs) -> str:
 templates.env.globals["t"] = _t
 
 
+def _stream_template(name: str, context: dict) -> StreamingResponse:
+    """
+    Render a template as a streamed HTML response.
+
+    Jinja emits the page in chunks, so the first bytes leave the server while
+    the rest of a long server table is still rendering instead of after the
+    whole page is buffered.
+
+    The request-scoped DB session is already closed by the time the stream
+    renders — yield-dependency teardown runs before the body is produced.
+    Everything in ``context`` must therefore be fully materialized up front:
+    lists via ``.all()``, no lazy queries, no unloaded relationships.
+    Passing a live result (e.g. ``yield_per``) here fails with closed-session
+    or DetachedInstanceError once it is iterated.
+    """
+    stream = templates.env.get_template(name).stream(context)
+    stream.enable_buffering(64)
+    return StreamingResponse(stream, media_type="text/html")
+
+
+@app.on_event("startup")
+async def configure_threadpool() -> None:
+    """
+    Raise the capacity of the shared threadpool that sync endpoints run on.
+
+    The handlers stay synchronous SQLModel code on purpose: SQLite's driver is
+    synchronous at heart, so an aiosqlite/AsyncSession port would still run
+    every query on a worker thread while adding await overhead to each one.
+    Under concurrent load the ceiling is the default 40-thread Starlette pool,
+    which THREADPOOL_SIZE lifts instead.
+    """
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    limiter.total_tokens = int(os.getenv("THREADPOOL_SIZE", "100"))
+
+
 @app.on_event("startup")
 def on_startup() -> None:
-    """Initialize database on startup."""
+    """Initialize database and warm the template cache on startup."""
     init_db()
+    # Force-compile every template now so the first request after boot renders
+    # from the in-memory cache instead of paying parse/compile cost.
+    for name in templates.env.list_templates():
+        templates.env.get_template(name)
+
+
+# Both PWA assets are tiny and immutable for the lifetime of the process, so
+# read them once at import instead of paying stat()+open()+stream per hit.
+with open("app/static/manifest.webmanifest", "rb") as _fh:
+    _MANIFEST_BYTES = _fh.read()
+with open("app/static/service-worker.js", "rb") as _fh:
+    _SERVICE_WORKER_BYTES = _fh.read()
 
 
 @app.get("/manifest.webmanifest")
-def manifest() -> FileResponse:
+def manifest() -> Response:
     """Serve the PWA manifest."""
-    return FileResponse(
-        "app/static/manifest.webmanifest", media_type="application/manifest+json"
+    return Response(
+        content=_MANIFEST_BYTES, media_type="application/manifest+json"
     )
 
 
 @app.get("/service-worker.js", include_in_schema=False)
-def service_worker() -> FileResponse:
+def service_worker() -> Response:
     """Serve the service worker from root scope."""
-    return FileResponse(
-        "app/static/service-worker.js",
+    return Response(
+        content=_SERVICE_WORKER_BYTES,
         media_type="application/javascript",
         headers={"Service-Worker-Allowed": "/"},
     )
@@ -115,20 +188,39 @@ def switch_language(code: str, request: Request):
 # ------------- Auth: Register / Login / Logout -------------
 
 
+def _any_user_exists(session: Session) -> bool:
+    # Only "does any user exist" is needed — probe one id instead of
+    # materializing every row.
+    return session.exec(select(User.id).limit(1)).first() is not None
+
+
+def _username_taken(session: Session, username: str) -> bool:
+    return (
+        session.exec(select(User.id).where(User.username == username)).first()
+        is not None
+    )
+
+
+def _persist_new_user(session: Session, user: User) -> None:
+    session.add(user)
+    session.commit()
+    session.refresh(user)
+
+
 @app.get("/register", response_class=HTMLResponse)
 def register_form(
     request: Request,
     session: Session = Depends(get_session),
-    current_user: Optional[User] = Depends(get_current_user),
+    current_user: Optional[AuthUser] = Depends(get_current_user),
 ):
     """
     Render the registration form.
 
     If at least one user already exists, only admins may register new users.
     """
-    user_count = len(session.exec(select(User)).all())
+    has_user = _any_user_exists(session)
     if (
-        user_count > 0
+        has_user
         and not ALLOW_SELF_REGISTRATION
         and (not current_user or not current_user.is_admin)
     ):
@@ -148,7 +240,7 @@ def register_form(
 
 
 @app.post("/register")
-def register(
+async def register(
     request: Request,
     username: str = Form(...),
     email: str = Form(""),
@@ -156,7 +248,7 @@ def register(
     password_confirm: str = Form(...),
     csrf_token: str = Form(...),
     session: Session = Depends(get_session),
-    current_user: Optional[User] = Depends(get_current_user),
+    current_user: Optional[AuthUser] = Depends(get_current_user),
 ):
     """
     Handle registration submissions.
@@ -177,9 +269,12 @@ def register(
             status_code=400,
         )
 
-    user_count = len(session.exec(select(User)).all())
+    # The handler is async only so the hash can await the password executor;
+    # its DB work must not run inline, where a contended SQLite commit (up to
+    # the 30 s busy timeout) would stall the whole event loop.
+    has_user = await run_in_threadpool(_any_user_exists, session)
     if (
-        user_count > 0
+        has_user
         and not ALLOW_SELF_REGISTRATION
         and (not current_user or not current_user.is_admin)
     ):
@@ -188,12 +283,10 @@ def register(
     error = None
     if password != password_confirm:
         error = "Passwords do not match."
-    else:
-        existing = session.exec(
-            select(User).where(User.username == username)
-        ).first()
-        if existing:
-            error = "Username is already taken."
+    elif password_too_long(password):
+        error = "Password is too long (max. 1024 bytes)."
+    elif await run_in_threadpool(_username_taken, session, username):
+        error = "Username is already taken."
 
     csrf_token = ensure_csrf_token(request)
 
@@ -212,23 +305,21 @@ def register(
     user = User(
         username=username,
         email=email or None,
-        password_hash=hash_password(password),
+        password_hash=await hash_password_async(password),
         is_active=True,
-        is_admin=(user_count == 0),  # first user is admin
+        is_admin=(not has_user),  # first user is admin
     )
-    session.add(user)
-    session.commit()
-    session.refresh(user)
+    await run_in_threadpool(_persist_new_user, session, user)
 
     # Auto-login after registration
-    request.session["user_id"] = user.id
+    request.session[SESSION_USER_KEY] = user.id
     return RedirectResponse("/", status_code=303)
 
 
 @app.get("/login", response_class=HTMLResponse)
 def login_form(
     request: Request,
-    current_user: Optional[User] = Depends(get_current_user),
+    current_user: Optional[AuthUser] = Depends(get_current_user),
 ):
     """Render the login form."""
     if current_user:
@@ -246,7 +337,7 @@ def login_form(
 
 
 @app.post("/login")
-def login(
+async def login(
     request: Request,
     username: str = Form(...),
     password: str = Form(...),
@@ -267,9 +358,9 @@ def login(
             status_code=400,
         )
 
-    user = session.exec(select(User).where(User.username == username)).first()
+    user = await verify_password_for_login_async(session, username, password)
     error = None
-    if not user or not verify_password(password, user.password_hash):
+    if not user:
         error = "Invalid username or password."
     elif not user.is_active:
         error = "User is deactivated."
@@ -288,7 +379,7 @@ def login(
             status_code=400,
         )
 
-    request.session["user_id"] = user.id
+    request.session[SESSION_USER_KEY] = user.id
     return RedirectResponse("/", status_code=303)
 
 
@@ -306,7 +397,7 @@ def logout(request: Request):
 def list_users(
     request: Request,
     session: Session = Depends(get_session),
-    current_user: User = Depends(require_admin),
+    current_user: AuthUser = Depends(require_admin),
 ):
     """List all users (admin only)."""
     users = session.exec(select(User).order_by(User.username)).all()
@@ -328,7 +419,7 @@ def toggle_user_active(
     request: Request,
     csrf_token: str = Form(...),
     session: Session = Depends(get_session),
-    current_user: User = Depends(require_admin),
+    current_user: AuthUser = Depends(require_admin),
 ):
     """
     Toggle a user's active state (admin only).
@@ -348,8 +439,8 @@ def toggle_user_active(
         return RedirectResponse("/users", status_code=303)
 
     user.is_active = not user.is_active
-    session.add(user)
     session.commit()
+    invalidate_user(user.id)
     return RedirectResponse("/users", status_code=303)
 
 
@@ -360,73 +451,33 @@ def toggle_user_active(
 def admin_dashboard(
     request: Request,
     session: Session = Depends(get_session),
-    current_user: User = Depends(require_admin),
+    current_user: AuthUser = Depends(require_admin),
 ):
     """
     Global admin dashboard aggregating all non-archived servers across all users.
-    """
-    servers = session.exec(
-        select(Server).where(Server.archived == False)
-    ).all()
-    users = session.exec(select(User)).all()
-
-    total_servers = len(servers)
-    total_users = len(users)
-    expiring_soon = sum(1 for s in servers if s.is_expiring_soon)
-    expired = sum(1 for s in servers if s.is_expired)
-
-    monthly_total = 0.0
-    currencies = set()
-    for s in servers:
-        if not s.price:
-            continue
-        if s.currency:
-            currencies.add(s.currency)
-        if s.billing_period == "yearly":
-            monthly_total += s.price / 12.0
-        else:
-            monthly_total += s.price
 
-    monthly_currency = None
-    if len(currencies) == 1:
-        monthly_currency = next(iter(currencies))
+    All counting and summing happens in SQL; the database returns one row of
+    totals plus roughly one row per provider instead of every Server row.
+    """
+    today = date.today()
+    soon = today + timedelta(days=30)
 
-    # Provider-level stats
-    provider_stats = {}
-    for s in servers:
-        provider = s.provider or "Unknown"
-        if provider not in provider_stats:
-            provider_stats[provider] = {
-                "count": 0,
-                "monthly_total": 0.0,
-                "expiring_soon": 0,
-                "expired": 0,
-                "currency_set": set(),
-            }
-        ps = provider_stats[provider]
-        ps["count"] += 1
-        if s.price:
-            if s.currency:
-                ps["currency_set"].add(s.currency)
-            if s.billing_period == "yearly":
-                ps["monthly_total"] += s.price / 12.0
-            else:
-                ps["monthly_total"] += s.price
-        if s.is_expiring_soon:
-            ps["expiring_soon"] += 1
-        if s.is_expired:
-            ps["expired"] += 1
-
-    # Contracts expiring soon and expired, for small lists
-    expiring_soon_list = sorted(
-        [s for s in servers if s.is_expiring_soon],
-        key=lambda s: s.contract_end or datetime.max.date(),
-    )
-    expired_list = sorted(
-        [s for s in servers if s.is_expired],
-        key=lambda s: s.contract_end or datetime.min.date(),
-        reverse=True,
+    monthly_price = case(
+        (Server.billing_period == "yearly", Server.price / 12.0),
+        else_=Server.price,
     )
+    expiring_soon_flag = case((Server.contract_end.between(today, soon), 1), else_=0)
+    expired_flag = case((Server.contract_end < today, 1), else_=0)
+
+    total_servers, monthly_total, expiring_soon, expired = session.exec(
+        select(
+            func.count(),
+            func.coalesce(func.sum(monthly_price), 0.0),
+            func.coalesce(func.sum(expiring_soon_flag), 0),
+            func.coalesce(func.sum(expired_flag), 0),
+        ).where(Server.archived == False)
+    ).one()
+    total_users = session.exec(select(func.count()).select_from(User)).one()
 
     stats = {
         "total_servers": total_servers,
@@ -434,10 +485,81 @@ def admin_dashboard(
         "expiring_soon": expiring_soon,
         "expired": expired,
         "monthly_total": monthly_total,
-        "monthly_currency": monthly_currency,
-        "mixed_currencies": len(currencies) > 1,
+        "monthly_currency": None,
+        "mixed_currencies": False,
     }
 
+    # Fresh install / everything archived: nothing to group or list, so skip
+    # the remaining four queries entirely.
+    if not total_servers:
+        return templates.TemplateResponse(
+            "admin_dashboard.html",
+            {
+                "request": request,
+                "current_user": current_user,
+                "stats": stats,
+                "provider_stats": {},
+                "expiring_soon_list": [],
+                "expired_list": [],
+            },
+        )
+
+    # Provider-level stats: one aggregate row per provider plus the distinct
+    # (provider, currency) pairs of servers that actually cost something.
+    provider_rows = session.exec(
+        select(
+            Server.provider,
+            func.count(),
+            func.coalesce(func.sum(monthly_price), 0.0),
+            func.coalesce(func.sum(expiring_soon_flag), 0),
+            func.coalesce(func.sum(expired_flag), 0),
+        )
+        .where(Server.archived == False)
+        .group_by(Server.provider)
+    ).all()
+    currency_rows = session.exec(
+        select(Server.provider, Server.currency)
+        .where(Server.archived == False)
+        .where(Server.price != 0)
+        .where(Server.currency != "")
+        .distinct()
+    ).all()
+
+    provider_stats = {}
+    for provider, count, p_monthly, p_soon, p_expired in provider_rows:
+        provider_stats[provider or "Unknown"] = {
+            "count": count,
+            "monthly_total": p_monthly,
+            "expiring_soon": p_soon,
+            "expired": p_expired,
+            "currency_set": set(),
+        }
+    currencies = set()
+    for provider, currency in currency_rows:
+        provider_stats[provider or "Unknown"]["currency_set"].add(currency)
+        currencies.add(currency)
+
+    if len(currencies) == 1:
+        stats["monthly_currency"] = next(iter(currencies))
+    stats["mixed_currencies"] = len(currencies) > 1
+
+    # Contracts expiring soon and expired, for small lists; only these two
+    # bounded queries hydrate Server rows at all.
+    expiring_soon_list = session.exec(
+        select(Server)
+        .where(Server.archived == False)
+        .where(Server.contract_end.between(today, soon))
+        .order_by(Server.contract_end, Server.name)
+        .limit(20)
+    ).all()
+    expired_list = session.exec(
+        select(Server)
+        .where(Server.archived == False)
+        .where(Server.contract_end < today)
+        .order_by(Server.contract_end.desc(), Server.name)
+        .limit(20)
+    ).all()
+
     return templates.TemplateResponse(
         "admin_dashboard.html",
         {
@@ -458,7 +580,7 @@ def admin_dashboard(
 def list_servers(
     request: Request,
     session: Session = Depends(get_session),
-    current_user: User = Depends(require_current_user),
+    current_user: AuthUser = Depends(require_current_user),
 ):
     """
     List all non-archived servers owned by the current user.
@@ -471,24 +593,32 @@ def list_servers(
         .order_by(Server.provider, Server.name)
     ).all()
 
-    # --- Dashboard stats ---
+    # --- Dashboard stats, computed in a single pass ---
+    # today/soon are evaluated once up front; the is_expiring_soon/is_expired
+    # properties would recompute date.today() for every row.
+    today = date.today()
+    soon = today + timedelta(days=30)
     total_servers = len(servers)
-    expiring_soon = sum(1 for s in servers if s.is_expiring_soon)
-    expired = sum(1 for s in servers if s.is_expired)
-
-    # Approximate total monthly cost
+    expiring_soon = expired = 0
     monthly_total = 0.0
     currencies = set()
     for s in servers:
-        if not s.price:
+        contract_end = s.contract_end
+        if contract_end:
+            if contract_end < today:
+                expired += 1
+            elif contract_end <= soon:
+                expiring_soon += 1
+        price = s.price
+        if not price:
             continue
         if s.currency:
             currencies.add(s.currency)
         if s.billing_period == "yearly":
-            monthly_total += s.price / 12.0
+            monthly_total += price / 12.0
         else:
             # treat "monthly" and "other" as monthly for the purpose of the overview
-            monthly_total += s.price
+            monthly_total += price
 
     monthly_currency = None
     if len(currencies) == 1:
@@ -503,11 +633,14 @@ def list_servers(
         "mixed_currencies": len(currencies) > 1,
     }
 
-    return templates.TemplateResponse(
+    # The list is already materialized for the stats pass above, but the
+    # render itself streams so large tables reach the browser incrementally.
+    return _stream_template(
         "servers_list.html",
         {
             "request": request,
             "servers": servers,
+            "server_rows": zip(servers, Server.compute_badges(servers)),
             "can_encrypt": can_encrypt(),
             "current_user": current_user,
             "stats": stats,
@@ -518,7 +651,7 @@ def list_servers(
 @app.get("/servers/new", response_class=HTMLResponse)
 def new_server_form(
     request: Request,
-    current_user: User = Depends(require_current_user),
+    current_user: AuthUser = Depends(require_current_user),
 ):
     """Render a blank form for creating a new server."""
     csrf_token = ensure_csrf_token(request)
@@ -563,7 +696,7 @@ def create_server(
     notes: str = Form(""),
     csrf_token: str = Form(...),
     session: Session = Depends(get_session),
-    current_user: User = Depends(require_current_user),
+    current_user: AuthUser = Depends(require_current_user),
 ):
     """Create a new server entry for the current user."""
     if not validate_csrf(request, csrf_token):
@@ -571,10 +704,8 @@ def create_server(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid CSRF token."
         )
 
-    c_start = (
-        datetime.fromisoformat(contract_start).date() if contract_start else None
-    )
-    c_end = datetime.fromisoformat(contract_end).date() if contract_end else None
+    c_start = date.fromisoformat(contract_start) if contract_start else None
+    c_end = date.fromisoformat(contract_end) if contract_end else None
 
     parsed_price = parse_decimal(price) or 0.0
     parsed_ram = parse_ram_mb(ram_mb)
@@ -582,13 +713,7 @@ def create_server(
 
     enc_pwd = encrypt_secret(mgmt_password) if mgmt_password else None
 
-    # Only allow http:// or https:// URLs to avoid javascript: schemes etc.
-    mgmt_url_clean = mgmt_url.strip()
-    if mgmt_url_clean and not (
-        mgmt_url_clean.lower().startswith("http://")
-        or mgmt_url_clean.lower().startswith("https://")
-    ):
-        mgmt_url_clean = ""
+    mgmt_url_clean = clean_mgmt_url(mgmt_url)
 
     server = Server(
         owner_id=current_user.id,
@@ -616,7 +741,6 @@ def create_server(
         ssh_user=ssh_user or None,
         ssh_key_hint=ssh_key_hint or None,
         notes=notes or None,
-        updated_at=datetime.utcnow(),
     )
     session.add(server)
     session.commit()
@@ -628,7 +752,7 @@ def create_server(
 def archived_servers(
     request: Request,
     session: Session = Depends(get_session),
-    current_user: User = Depends(require_current_user),
+    current_user: AuthUser = Depends(require_current_user),
 ):
     """List archived servers for the current user."""
     servers = session.exec(
@@ -640,7 +764,7 @@ def archived_servers(
 
     csrf_token = ensure_csrf_token(request)
 
-    return templates.TemplateResponse(
+    return _stream_template(
         "servers_archived.html",
         {
             "request": request,
@@ -656,7 +780,7 @@ def server_detail(
     server_id: int,
     request: Request,
     session: Session = Depends(get_session),
-    current_user: User = Depends(require_current_user),
+    current_user: AuthUser = Depends(require_current_user),
 ):
     """Show details for a single server."""
     server = session.get(Server, server_id)
@@ -688,7 +812,7 @@ def edit_server_form(
     server_id: int,
     request: Request,
     session: Session = Depends(get_session),
-    current_user: User = Depends(require_current_user),
+    current_user: AuthUser = Depends(require_current_user),
 ):
     """Render a pre-filled form for editing an existing server."""
     server = session.get(Server, server_id)
@@ -739,7 +863,7 @@ def update_server(
     notes: str = Form(""),
     csrf_token: str = Form(...),
     session: Session = Depends(get_session),
-    current_user: User = Depends(require_current_user),
+    current_user: AuthUser = Depends(require_current_user),
 ):
     """Update an existing server entry (only owner)."""
     server = session.get(Server, server_id)
@@ -751,22 +875,15 @@ def update_server(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid CSRF token."
         )
 
-    c_start = (
-        datetime.fromisoformat(contract_start).date() if contract_start else None
-    )
-    c_end = datetime.fromisoformat(contract_end).date() if contract_end else None
+    c_start = date.fromisoformat(contract_start) if contract_start else None
+    c_end = date.fromisoformat(contract_end) if contract_end else None
 
     # Only update mgmt password if a non-empty value was submitted.
     if mgmt_password:
         enc_pwd = encrypt_secret(mgmt_password)
         server.mgmt_password_encrypted = enc_pwd
 
-    mgmt_url_clean = mgmt_url.strip()
-    if mgmt_url_clean and not (
-        mgmt_url_clean.lower().startswith("http://")
-        or mgmt_url_clean.lower().startswith("https://")
-    ):
-        mgmt_url_clean = ""
+    mgmt_url_clean = clean_mgmt_url(mgmt_url)
 
     server.name = name
     server.provider = provider
@@ -792,9 +909,7 @@ def update_server(
     server.ssh_user = ssh_user or None
     server.ssh_key_hint = ssh_key_hint or None
     server.notes = notes or None
-    server.updated_at = datetime.utcnow()
 
-    session.add(server)
     session.commit()
     return RedirectResponse(f"/servers/{server_id}", status_code=303)
 
@@ -805,7 +920,7 @@ def archive_server(
     request: Request,
     csrf_token: str = Form(...),
     session: Session = Depends(get_session),
-    current_user: User = Depends(require_current_user),
+    current_user: AuthUser = Depends(require_current_user),
 ):
     """
     Soft-delete (archive) a server.
@@ -822,8 +937,6 @@ def archive_server(
         return RedirectResponse("/", status_code=303)
 
     server.archived = True
-    server.updated_at = datetime.utcnow()
-    session.add(server)
     session.commit()
     return RedirectResponse("/", status_code=303)
 
@@ -834,7 +947,7 @@ def unarchive_server(
     request: Request,
     csrf_token: str = Form(...),
     session: Session = Depends(get_session),
-    current_user: User = Depends(require_current_user),
+    current_user: AuthUser = Depends(require_current_user),
 ):
     """Restore an archived server."""
     if not validate_csrf(request, csrf_token):
@@ -847,8 +960,6 @@ def unarchive_server(
         return RedirectResponse("/", status_code=303)
 
     server.archived = False
-    server.updated_at = datetime.utcnow()
-    session.add(server)
     session.commit()
     return RedirectResponse("/servers/archived", status_code=303)
 
@@ -860,7 +971,7 @@ def unarchive_server(
 def server_map(
     request: Request,
     session: Session = Depends(get_session),
-    current_user: User = Depends(require_current_user),
+    current_user: AuthUser = Depends(require_current_user),
 ):
     """
     Show a per-user map view with all non-archived servers.
@@ -1,76 +1,147 @@
-from datetime import date, datetime
-from typing import Optional, List
+import time
+from datetime import date, datetime, timezone
+from functools import lru_cache
+from typing import NamedTuple
 
+from sqlalchemy import Column, DateTime, Index, and_, func
+from sqlalchemy.ext.hybrid import hybrid_property
 from sqlmodel import SQLModel, Field, Relationship
 
 
+@lru_cache(maxsize=1)
+def _today_for_minute(epoch_minute: int) -> date:
+    return date.today()
+
+
+def _today() -> date:
+    """
+    date.today() memoized per minute.
+
+    The badge properties below run once per rendered row; caching on the
+    current epoch minute turns 3N today() constructions per list view into
+    at most one, while still rolling over at (close to) midnight.
+    """
+    return _today_for_minute(int(time.time() // 60))
+
+
 class User(SQLModel, table=True):
     """Application user model."""
 
-    id: Optional[int] = Field(default=None, primary_key=True)
+    id: int | None = Field(default=None, primary_key=True)
 
     username: str = Field(index=True, unique=True)
-    email: Optional[str] = Field(default=None, index=True)
-    password_hash: str
+    email: str | None = Field(default=None, index=True)
+    # argon2id hashes are ~95 chars, bcrypt 60; 128 leaves headroom while
+    # giving the column a declared width.
+    password_hash: str = Field(max_length=128)
 
     is_active: bool = Field(default=True)
     is_admin: bool = Field(default=False)
 
-    servers: List["Server"] = Relationship(back_populates="owner")
+    servers: list["Server"] = Relationship(back_populates="owner")
+
+
+class ServerBadges(NamedTuple):
+    """Per-server badge state precomputed for list views."""
+
+    days_until_contract_end: int | None
+    is_expired: bool
+    is_expiring_soon: bool
 
 
 class Server(SQLModel, table=True):
     """Server/VPS entry owned by a user."""
 
-    id: Optional[int] = Field(default=None, primary_key=True)
+    # Pydantic would otherwise treat the hybrid_property descriptors below as
+    # un-annotated fields.
+    model_config = {"ignored_types": (hybrid_property,)}
+
+    # Covers the dominant access path: this user's active servers ordered or
+    # filtered by contract end (lists, expiring-soon, admin aggregates).
+    __table_args__ = (
+        Index("ix_server_owner_active_end", "owner_id", "archived", "contract_end"),
+    )
+
+    id: int | None = Field(default=None, primary_key=True)
 
     # Owner
-    owner_id: int = Field(foreign_key="user.id")
-    owner: Optional[User] = Relationship(back_populates="servers")
+    owner_id: int = Field(foreign_key="user.id", index=True)
+    owner: User | None = Relationship(back_populates="servers")
 
     # General info
     name: str
-    hostname: Optional[str] = None
-    type: str = "vps"  # vps, dedicated, storage, managed, other
+    hostname: str | None = None
+    type: str = Field(default="vps", max_length=16)  # vps, dedicated, storage, managed, other
     provider: str
-    location: Optional[str] = None
+    location: str | None = None
 
     # Network
-    ipv4: Optional[str] = None
-    ipv6: Optional[str] = None
+    ipv4: str | None = Field(default=None, max_length=15)
+    ipv6: str | None = Field(default=None, max_length=45)
 
     # Cost / billing
-    billing_period: str = "monthly"  # monthly, yearly, other
+    billing_period: str = Field(default="monthly", max_length=16)  # monthly, yearly, other
     price: float = 0.0
-    currency: str = "EUR"
-    contract_start: Optional[date] = None
-    contract_end: Optional[date] = None
-    tags: Optional[str] = None  # e.g. "prod,critical,backup"
+    currency: str = Field(default="EUR", max_length=3)
+    contract_start: date | None = None
+    contract_end: date | None = Field(default=None, index=True)
+    tags: str | None = None  # e.g. "prod,critical,backup"
 
     # Hardware
-    cpu_model: Optional[str] = None
-    cpu_cores: Optional[int] = None
-    ram_mb: Optional[int] = None
-    storage_gb: Optional[int] = None
-    storage_type: Optional[str] = None  # nvme, ssd, hdd, ceph, ...
+    cpu_model: str | None = None
+    cpu_cores: int | None = None
+    ram_mb: int | None = None
+    storage_gb: int | None = None
+    storage_type: str | None = None  # nvme, ssd, hdd, ceph, ...
 
     # Access (no private SSH keys, only hints)
-    mgmt_url: Optional[str] = None
-    mgmt_user: Optional[str] = None
-    mgmt_password_encrypted: Optional[str] = None
-    ssh_user: Optional[str] = None
-    ssh_key_hint: Optional[str] = None  # e.g. "id_ed25519_ovh"
+    mgmt_url: str | None = None
+    mgmt_user: str | None = None
+    mgmt_password_encrypted: str | None = None
+    ssh_user: str | None = None
+    ssh_key_hint: str | None = None  # e.g. "id_ed25519_ovh"
+
+    notes: str | None = None
+
+    # The Python default keeps inserts working on databases created before the
+    # columns had a DDL default; onupdate stamps updated_at in the UPDATE
+    # statement itself, so write endpoints no longer set it by hand.
+    created_at: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc),
+        sa_column=Column(DateTime, nullable=False, server_default=func.now()),
+    )
+    updated_at: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc),
+        sa_column=Column(
+            DateTime, nullable=False, server_default=func.now(), onupdate=func.now()
+        ),
+    )
+    archived: bool = Field(default=False, index=True)
 
-    notes: Optional[str] = None
+    # ----- Convenience properties for badges / UI -----
 
-    created_at: datetime = Field(default_factory=datetime.utcnow)
-    updated_at: datetime = Field(default_factory=datetime.utcnow)
-    archived: bool = Field(default=False)
+    @classmethod
+    def compute_badges(cls, rows: list["Server"]) -> list[ServerBadges]:
+        """
+        Compute badge state for a batch of servers in one pass.
 
-    # ----- Convenience properties for badges / UI -----
+        List views that would otherwise touch the three properties below per
+        row compute the contract delta once per server here, against a single
+        shared "today".
+        """
+        today = _today()
+        badges = []
+        for server in rows:
+            end = server.contract_end
+            if end is None:
+                badges.append(ServerBadges(None, False, False))
+            else:
+                days = (end - today).days
+                badges.append(ServerBadges(days, days < 0, 0 <= days <= 30))
+        return badges
 
     @property
-    def days_until_contract_end(self) -> Optional[int]:
+    def days_until_contract_end(self) -> int | None:
         """
         Number of days until the contract_end date.
 
@@ -81,14 +152,23 @@ class Server(SQLModel, table=True):
         """
         if not self.contract_end:
             return None
-        return (self.contract_end - date.today()).days
+        return (self.contract_end - _today()).days
 
-    @property
+    @hybrid_property
     def is_expired(self) -> bool:
         """Return True if the contract_end date lies in the past."""
-        return self.contract_end is not None and self.contract_end < date.today()
+        days = self.days_until_contract_end
+        return days is not None and days < 0
 
-    @property
+    @is_expired.expression
+    def is_expired(cls):
+        # Usable in WHERE clauses: filter expired rows in SQL instead of
+        # hydrating every Server just to discard most of them in Python.
+        return and_(
+            cls.contract_end.is_not(None), cls.contract_end < func.current_date()
+        )
+
+    @hybrid_property
     def is_expiring_soon(self) -> bool:
         """
         Return True if the contract will end within the next 30 days.
@@ -97,3 +177,11 @@ class Server(SQLModel, table=True):
         """
         days = self.days_until_contract_end
         return days is not None and 0 <= days <= 30
+
+    @is_expiring_soon.expression
+    def is_expiring_soon(cls):
+        return and_(
+            cls.contract_end.is_not(None),
+            cls.contract_end >= func.current_date(),
+            cls.contract_end <= func.date("now", "+30 days"),
+        )
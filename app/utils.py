@@ -3,62 +3,204 @@ import hashlib
 import os
 import secrets
 import re
-from typing import Optional
+from functools import lru_cache
+from typing import List, Optional
 
+from cryptography.exceptions import InvalidTag
 from cryptography.fernet import Fernet, InvalidToken
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from starlette.requests import Request
 
-# Optional symmetric encryption for management passwords
-_ENC_KEY = os.getenv("ENCRYPTION_KEY")
-_f = None
+# Optional symmetric encryption for management passwords. Key material and
+# cipher objects are built lazily on first use so worker startup does not pay
+# OpenSSL key scheduling, and read-only processes never pay it at all.
 
-if _ENC_KEY:
+
+@lru_cache(maxsize=1)
+def _key_bytes() -> Optional[bytes]:
+    """
+    Derive the 32 raw key bytes from ENCRYPTION_KEY, or None if unset/invalid.
+
+    Accepts either a full Fernet key (urlsafe base64) or an arbitrary
+    passphrase that is hashed down to 32 bytes.
+    """
+    raw = os.getenv("ENCRYPTION_KEY")
+    if not raw:
+        return None
+    key_str = raw.strip()
     try:
-        key_str = _ENC_KEY.strip()
-        # Accept either a full Fernet key or derive one from an arbitrary passphrase.
         if len(key_str) >= 44 and key_str.endswith("="):
-            fernet_key = key_str.encode()
-        else:
-            digest = hashlib.sha256(key_str.encode("utf-8")).digest()
-            fernet_key = base64.urlsafe_b64encode(digest)
-        _f = Fernet(fernet_key)
+            return base64.urlsafe_b64decode(key_str.encode())
+        return hashlib.sha256(key_str.encode("utf-8")).digest()
     except Exception:
-        _f = None
+        return None
+
+
+@lru_cache(maxsize=1)
+def _fernet() -> Optional[Fernet]:
+    """Singleton Fernet cipher for the legacy token format."""
+    key = _key_bytes()
+    if key is None or len(key) != 32:
+        return None
+    return Fernet(base64.urlsafe_b64encode(key))
+
+
+@lru_cache(maxsize=1)
+def _aesgcm() -> Optional[AESGCM]:
+    """Singleton AES-256-GCM cipher sharing the Fernet key bytes."""
+    key = _key_bytes()
+    if key is None or len(key) != 32:
+        return None
+    return AESGCM(key)
 
 
 def can_encrypt() -> bool:
-    """Return True if an encryption key has been configured."""
-    return _f is not None
+    """Return True if a usable encryption key has been configured."""
+    # Check the cipher, not just the key bytes: a full-length key that decodes
+    # to the wrong size yields key bytes but no cipher, and the UI must not
+    # offer a management-password field whose value would be dropped.
+    return _aesgcm() is not None
+
+
+# Fernet tokens always start with base64("\x80" + timestamp), i.e. "gAAAA".
+_FERNET_TOKEN_PREFIX = "gAAAA"
 
 
 def encrypt_secret(plaintext: str) -> Optional[str]:
-    """Encrypt a secret string using Fernet, if configured."""
-    if not plaintext or not _f:
+    """
+    Encrypt a secret with AES-256-GCM: 12-byte random nonce, then ciphertext.
+
+    One authenticated pass instead of Fernet's AES-CBC plus separate
+    HMAC-SHA256 and inner base64 round trip — tokens are roughly half the
+    size and decryption is cheaper on the server-detail hot path.
+    """
+    gcm = _aesgcm()
+    if not plaintext or not gcm:
         return None
-    token = _f.encrypt(plaintext.encode("utf-8"))
-    return token.decode("utf-8")
+    # isascii() is a flag check on str objects and the ascii codec is a plain
+    # memcpy, skipping UTF-8 validation for the common all-ASCII password.
+    raw = plaintext.encode("ascii") if plaintext.isascii() else plaintext.encode("utf-8")
+    nonce = os.urandom(12)
+    ciphertext = gcm.encrypt(nonce, raw, None)
+    return base64.urlsafe_b64encode(nonce + ciphertext).decode("ascii")
 
 
 def decrypt_secret(token: str) -> Optional[str]:
-    """Decrypt a Fernet-encrypted token, returning a string or None."""
-    if not token or not _f:
+    """
+    Decrypt a stored secret token, returning a string or None.
+
+    Tokens written before the AES-GCM switch carry Fernet's "gAAAA" prefix
+    and are decrypted with the legacy cipher; they are rewritten in the new
+    format the next time the secret is saved.
+
+    Results are memoized per ciphertext: decryption is deterministic under a
+    fixed key, so re-rendering the same server detail page skips the crypto
+    entirely.
+    """
+    if not token:
+        return None
+    return _decrypt_cached(token)
+
+
+@lru_cache(maxsize=1024)
+def _decrypt_cached(token: str) -> Optional[str]:
+    if token.startswith(_FERNET_TOKEN_PREFIX):
+        f = _fernet()
+        if not f:
+            return None
+        try:
+            return f.decrypt(token.encode("utf-8")).decode("utf-8")
+        except (InvalidToken, ValueError):
+            return None
+    gcm = _aesgcm()
+    if not gcm:
         return None
     try:
-        plaintext = _f.decrypt(token.encode("utf-8"))
-        return plaintext.decode("utf-8")
-    except (InvalidToken, ValueError):
+        raw = base64.urlsafe_b64decode(token.encode("ascii"))
+        plaintext = gcm.decrypt(raw[:12], raw[12:], None)
+        return (
+            plaintext.decode("ascii")
+            if plaintext.isascii()
+            else plaintext.decode("utf-8")
+        )
+    except (InvalidTag, ValueError):
         return None
 
 
+def encrypt_secrets_bulk(plaintexts: List[str]) -> List[Optional[str]]:
+    """
+    Encrypt a batch of secrets, e.g. during a key-rotation sweep.
+
+    Resolves the cipher once and draws all nonces from a single urandom call
+    instead of paying the lookup and syscall per record. Tokens are the same
+    AES-GCM format encrypt_secret produces.
+    """
+    gcm = _aesgcm()
+    if not gcm:
+        return [None] * len(plaintexts)
+    nonces = os.urandom(12 * len(plaintexts))
+    out: List[Optional[str]] = []
+    for i, plaintext in enumerate(plaintexts):
+        if not plaintext:
+            out.append(None)
+            continue
+        raw = (
+            plaintext.encode("ascii")
+            if plaintext.isascii()
+            else plaintext.encode("utf-8")
+        )
+        nonce = nonces[i * 12 : (i + 1) * 12]
+        out.append(
+            base64.urlsafe_b64encode(nonce + gcm.encrypt(nonce, raw, None)).decode(
+                "ascii"
+            )
+        )
+    return out
+
+
+def reset_crypto_cache() -> None:
+    """Forget cached key material, ciphers and decrypts after a key rotation."""
+    _decrypt_cached.cache_clear()
+    _aesgcm.cache_clear()
+    _fernet.cache_clear()
+    _key_bytes.cache_clear()
+
+
 # ----- Parsing helpers -----
 
+_URL_PREFIXES = ("http://", "https://")
+
+
+def clean_mgmt_url(value: str) -> str:
+    """
+    Strip a management URL and keep it only if it is http(s).
+
+    Rejecting everything else guards against javascript: and similar schemes.
+    Only the first 8 characters are lowercased; startswith with a tuple scans
+    both prefixes in one C-level call.
+    """
+    value = value.strip()
+    if value and value[:8].lower().startswith(_URL_PREFIXES):
+        return value
+    return ""
+
+# Compiled once at import: avoids the per-call pattern-cache lookup, and the
+# character class is fixed — the previous inline r"[\\.,]" matched a literal
+# backslash instead of dot/comma.
+_RAM_RE = re.compile(r"([0-9]+(?:[.,][0-9]+)?)(tb|gb|mb)?")
+_STORAGE_RE = re.compile(r"([0-9]+(?:[.,][0-9]+)?)(tb|gb)?")
+
+# Single-character substitution via translate beats str.replace and returns
+# the original object unchanged when no comma is present.
+_COMMA_TO_DOT = str.maketrans({",": "."})
+
+
 def parse_decimal(value: str) -> Optional[float]:
     """Parse a decimal number allowing comma or dot."""
     if not value:
         return None
     try:
-        normalized = value.replace(",", ".").strip()
-        return float(normalized)
+        return float(value.strip().translate(_COMMA_TO_DOT))
     except ValueError:
         return None
 
@@ -71,10 +213,10 @@ def parse_ram_mb(value: str) -> Optional[int]:
     if not value:
         return None
     v = value.strip().lower()
-    match = re.match(r"([0-9]+(?:[\\.,][0-9]+)?)(tb|gb|mb)?", v)
+    match = _RAM_RE.match(v)
     if not match:
         return None
-    number = float(match.group(1).replace(",", "."))
+    number = float(match.group(1).translate(_COMMA_TO_DOT))
     unit = match.group(2) or "gb"
     if unit == "tb":
         return int(number * 1024 * 1024)
@@ -91,10 +233,10 @@ def parse_storage_gb(value: str) -> Optional[int]:
     if not value:
         return None
     v = value.strip().lower()
-    match = re.match(r"([0-9]+(?:[\\.,][0-9]+)?)(tb|gb)?", v)
+    match = _STORAGE_RE.match(v)
     if not match:
         return None
-    number = float(match.group(1).replace(",", "."))
+    number = float(match.group(1).translate(_COMMA_TO_DOT))
     unit = match.group(2) or "gb"
     if unit == "tb":
         return int(number * 1024)
@@ -109,10 +251,17 @@ def ensure_csrf_token(request: Request) -> str:
     """
     Ensure the current session has a CSRF token and return it.
     """
+    # Return before generating anything on the steady-state hit path. Any
+    # session write marks the session dirty and makes SessionMiddleware
+    # re-sign and re-emit the cookie with the response, so this helper must
+    # only mutate request.session when a token truly does not exist yet.
     token = request.session.get(_CSRF_SESSION_KEY)
-    if not token:
-        token = secrets.token_urlsafe(32)
-        request.session[_CSRF_SESSION_KEY] = token
+    if token:
+        return token
+    # 128 bits of entropy is plenty for CSRF; the shorter token keeps the
+    # signed session cookie (re-HMAC'd and base64'd every request) small.
+    token = secrets.token_urlsafe(16)
+    request.session[_CSRF_SESSION_KEY] = token
     return token
 
 
@@ -121,6 +270,11 @@ def validate_csrf(request: Request, token: str) -> bool:
     Compare provided token with the one stored in the session.
     """
     stored = request.session.get(_CSRF_SESSION_KEY)
-    if not stored or not token:
+    # Reject non-strings outright instead of coercing via str(): a session
+    # poisoned with another type should fail, not run arbitrary __str__.
+    if not isinstance(stored, str) or not isinstance(token, str) or not stored:
         return False
-    return secrets.compare_digest(str(stored), str(token))
+    # No length short-circuit: compare_digest on bytes handles unequal
+    # lengths in time proportional to the longer input, so a mismatched
+    # submission does not leak the server token's length.
+    return secrets.compare_digest(stored.encode(), token.encode())